@@ -1,50 +1,185 @@
 from SignalDetection import SignalDetection
+import math
 import numpy as np
 import scipy.stats
+import sys
+
+# numba is only imported by _compile(), once a jitted logTarget shows that it is already loaded
+numba = None
+
+
+def _mh_loop(logTarget, x0, logTarget0, step, z, logUs, adaptive, iteration, target):
+    """
+    Compiled counterpart of the loop in Metropolis.__run, used when logTarget is itself a
+    numba-jitted function. z and logUs are drawn by the caller, so the chain does not depend on
+    numba's internal random state. Returns the samples, the final state, its log target, the
+    final step size and the number of accepted proposals.
+    """
+    out = np.empty(z.shape[0])
+    cur = x0
+    lp = logTarget0
+    logStep = np.log(step)
+    accepts = 0
+    for i in range(z.shape[0]):
+        proposal = cur + step * z[i]
+        logProp = logTarget(proposal)
+        logRatio = logProp - lp
+        accepted = logRatio >= 0 or logUs[i] < logRatio
+        if accepted:
+            cur = proposal
+            lp = logProp
+            accepts += 1
+        if adaptive:
+            logStep += (accepted - target) / (iteration + i + 1) ** 0.6
+            step = np.exp(logStep)
+        out[i] = cur
+    return out, cur, lp, step, accepts
+
+
+def _mh_multi(logTarget, x0s, zAdapt, logUsAdapt, z, logUs, target):
+    """
+    Runs one chain per entry of x0s on numba's thread pool: an adaptation phase over
+    zAdapt/logUsAdapt (skipped if they have no columns) followed by sampling over z/logUs.
+    All random draws come from the caller, one row per chain. Returns the sampled draws as
+    an array of shape (number of chains, number of samples).
+    """
+    out = np.empty(z.shape)
+    for c in numba.prange(x0s.shape[0]):
+        cur = x0s[c]
+        lp = logTarget(cur)
+        step = 1.0
+        if zAdapt.shape[1] > 0:
+            _, cur, lp, step, _ = _mh_loop(logTarget, cur, lp, step, zAdapt[c], logUsAdapt[c],
+                                           True, 0, target)
+        out[c], _, _, _, _ = _mh_loop(logTarget, cur, lp, step, z[c], logUs[c], False, 0, target)
+    return out
+
+
+def _compile():
+    """
+    Replaces the loops above with their numba-compiled versions on first use.
+    """
+    global numba, _mh_loop, _mh_multi
+    if numba is None:
+        import numba
+        _mh_loop = numba.njit(_mh_loop)
+        _mh_multi = numba.njit(parallel = True)(_mh_multi)
+
+
+def _isJitted(func):
+    """
+    Returns True if func is a numba-compiled function that can be called from _mh_loop, and
+    compiles the loops if so.
+    """
+    loaded = sys.modules.get('numba')
+    if loaded is None or not isinstance(func, loaded.core.dispatcher.Dispatcher):
+        return False
+    _compile()
+    return True
+
+
+def _run_one(logTarget, initialState, nSamples, blockLengths, seed, dtype):
+    """
+    Runs a single independent chain for Metropolis.run_chains and returns its nSamples draws
+    after the (optional) adaptation phase.
+    """
+    sampler = Metropolis(logTarget, initialState, seed = seed, dtype = dtype)
+    if blockLengths is not None:
+        sampler.adapt(blockLengths)
+    sampler.sample(nSamples)
+    return sampler.samples[sampler.samples.size - nSamples:]
+
 
 class Metropolis:
 
-    def __init__(self, logTarget, initialState):
+    def __init__(self, logTarget, initialState, seed = None, dtype = np.float32):
         self.logTarget = logTarget
         self.currentState = initialState
+        self.currentLogTarget = logTarget(initialState)
         self.stepSize = 1.0
-        self.samples = [initialState]
+        # the chain itself and logTarget are computed in float64; dtype only sets how the samples
+        # are stored, which is all summary() and plotting need
+        self.dtype = dtype
+        self.samples = np.array([initialState], dtype = dtype)
+        self.acceptCount = 0
         self.acceptanceRate = None
+        self.adaptIterations = 0
+        self.rng = np.random.default_rng(seed)
 
-    def __accept(self, proposal):
+    def __accept(self, proposal, logU):
         """
         A private method that checks whether to accept or reject the proposed value proposal
         based on the acceptance probability calculated from the current state and the proposed
-        state. It returns True if the proposal is accepted and False otherwise.
+        state. logU is a pre-drawn log-uniform used for the acceptance test. The log target of the
+        current state is cached so that only the proposal has to be evaluated, and uphill
+        proposals are accepted without looking at logU. It updates the current state and returns
+        True if the proposal is accepted and False otherwise.
         """
-        logRatio = self.logTarget(proposal) - self.logTarget(self.currentState)
-        if np.log(np.random.uniform()) < logRatio:
+        logProp = self.logTarget(proposal)
+        logRatio = logProp - self.currentLogTarget
+        if logRatio >= 0 or logU < logRatio:
             self.currentState = proposal
-            self.samples.append(proposal)
+            self.currentLogTarget = logProp
+            self.acceptCount += 1
             return True
+        return False
+
+
+    def __run(self, nSamples, adaptive = False, target = 0.44):
+        """
+        A private method that runs nSamples iterations of the Metropolis algorithm, writing the
+        chain into a preallocated array. The standard normal proposal steps and the log-uniforms
+        for the acceptance test are drawn up front in one vectorized call each. It returns the
+        array and the number of accepted proposals. If logTarget is numba-jitted the loop runs in
+        compiled code, otherwise it falls back to the pure Python loop. When adaptive is True
+        the log step size is also moved towards the target acceptance rate after every
+        iteration, with a Robbins-Monro step of size 1 / t^0.6. t counts all adaptation
+        iterations so far, so repeated calls to adapt keep diminishing the adaptation.
+        """
+        z = self.rng.standard_normal(nSamples)
+        logUs = np.log(self.rng.random(nSamples))
+        if _isJitted(self.logTarget):
+            buf, cur, logCur, step, accepts = _mh_loop(
+                self.logTarget, float(self.currentState), float(self.currentLogTarget),
+                self.stepSize, z, logUs, adaptive, self.adaptIterations, target)
+            self.currentState = cur
+            self.currentLogTarget = logCur
+            self.acceptCount += accepts
+            buf = buf.astype(self.dtype, copy = False)
         else:
-            self.samples.append(self.currentState)
-            return False
+            buf = np.empty(nSamples, dtype = self.dtype)
+            step = self.stepSize
+            logStep = math.log(step)
+            accepts = 0
+            for i in range(nSamples):
+                proposal = self.currentState + step * z[i]
+                accepted = self.__accept(proposal, logUs[i])
+                accepts += accepted
+                if adaptive:
+                    logStep += (accepted - target) / (self.adaptIterations + i + 1) ** 0.6
+                    step = math.exp(logStep)
+                buf[i] = self.currentState
+        if adaptive:
+            self.stepSize = float(step)
+            self.adaptIterations += nSamples
+        return buf, accepts
 
 
     def adapt(self, blockLengths):
         """
         Performs the adaptation phase of the Metropolis algorithm. It tries to adjust the step
-        size sigma  to achieve a target acceptance rate of approximately 0.4. It does so by running
+        size sigma to achieve a target acceptance rate of approximately 0.44. It does so by running
         a few blocks of iterations (the number of blocks and their length defined by blockLengths)
-        and adjusting the sigma value using a formula based on the acceptance rate.
+        and updating log sigma after every iteration with a Robbins-Monro step that shrinks as
+        the adaptation goes on. acceptanceRate is the acceptance rate of the last block.
         """
         acceptanceRate = 0
+        blocks = []
         for blockLength in blockLengths:
-            accepts = 0
-            for i in range(blockLength):
-                proposal = np.random.normal(loc = self.currentState, scale = self.stepSize)
-                accepts += self.__accept(proposal)
+            buf, accepts = self.__run(blockLength, adaptive = True)
+            blocks.append(buf)
             acceptanceRate = accepts / blockLength
-            if acceptanceRate < 0.1:
-                self.stepSize /= 2
-            elif acceptanceRate > 0.6:
-                self.stepSize *= 2
+        self.samples = np.concatenate([self.samples] + blocks)
         self.acceptanceRate = acceptanceRate
         return self
 
@@ -56,9 +191,8 @@ class Metropolis:
         current state as the mean and sigma_K as the standard deviation. If the proposed state is
         accepted, it becomes the new state.
         """
-        for i in range(nSamples):
-            proposal = np.random.normal(loc = self.currentState, scale = self.stepSize)
-            self.__accept(proposal)
+        buf, accepts = self.__run(nSamples)
+        self.samples = np.concatenate([self.samples, buf])
         return self
 
 
@@ -67,6 +201,72 @@ class Metropolis:
         Returns a dictionary or structure containing the mean and 95% credible interval of the
         generated samples.
         """
-        return {'mean': np.mean(self.samples), 'c025': np.percentile(self.samples, 2.5),
-                'c975': np.percentile(self.samples, 97.5)}
+        c025, c975 = np.percentile(self.samples, [2.5, 97.5])
+        return {'mean': np.mean(self.samples, dtype = np.float64), 'c025': c025, 'c975': c975}
+
 
+    @classmethod
+    def run_chains(cls, logTarget, initialStates, nSamples, n_jobs = 1, blockLengths = None,
+                   seed = None, dtype = np.float32):
+        """
+        Runs one independent chain per entry of initialStates. If logTarget is numba-jitted the
+        chains run on numba's threads in this process; otherwise they run in parallel across
+        n_jobs processes when joblib is available and sequentially if not. Each chain gets its
+        own random generator spawned from seed, and is adapted with blockLengths first if given.
+        Returns the draws as an array of shape (number of chains, nSamples) stored as dtype.
+        """
+        seeds = np.random.SeedSequence(seed).spawn(len(initialStates))
+        if _isJitted(logTarget):
+            nAdapt = sum(blockLengths) if blockLengths is not None else 0
+            zAdapt = np.empty((len(seeds), nAdapt))
+            logUsAdapt = np.empty((len(seeds), nAdapt))
+            z = np.empty((len(seeds), nSamples))
+            logUs = np.empty((len(seeds), nSamples))
+            # draw in the same order as a single Metropolis(seed = s) would, block by block
+            for c, s in enumerate(seeds):
+                rng = np.random.default_rng(s)
+                start = 0
+                for blockLength in (blockLengths or []):
+                    zAdapt[c, start:start + blockLength] = rng.standard_normal(blockLength)
+                    logUsAdapt[c, start:start + blockLength] = np.log(rng.random(blockLength))
+                    start += blockLength
+                z[c] = rng.standard_normal(nSamples)
+                logUs[c] = np.log(rng.random(nSamples))
+            chains = _mh_multi(logTarget, np.asarray(initialStates, dtype = np.float64), zAdapt,
+                               logUsAdapt, z, logUs, 0.44)
+            return chains.astype(dtype, copy = False)
+        try:
+            import joblib
+        except ImportError:
+            joblib = None
+        if joblib is None:
+            chains = [_run_one(logTarget, x0, nSamples, blockLengths, s, dtype)
+                      for x0, s in zip(initialStates, seeds)]
+        else:
+            chains = joblib.Parallel(n_jobs = n_jobs)(
+                joblib.delayed(_run_one)(logTarget, x0, nSamples, blockLengths, s, dtype)
+                for x0, s in zip(initialStates, seeds))
+        return np.vstack(chains)
+
+
+    @staticmethod
+    def summarize_chains(chains):
+        """
+        Returns a dictionary containing the mean and 95% credible interval of each chain and of
+        the pooled draws, together with the Gelman-Rubin R-hat convergence statistic. R-hat is
+        nan when there is only one chain.
+        """
+        chains = np.atleast_2d(chains)
+        nChains, n = chains.shape
+        chainMeans = chains.mean(axis = 1, dtype = np.float64)
+        intervals = np.percentile(chains, [2.5, 97.5], axis = 1)
+        c025, c975 = np.percentile(chains, [2.5, 97.5])
+        result = {'mean': chainMeans.mean(), 'c025': c025, 'c975': c975,
+                  'chains': [{'mean': chainMeans[i], 'c025': intervals[0, i],
+                              'c975': intervals[1, i]} for i in range(nChains)],
+                  'rhat': np.nan}
+        if nChains > 1:
+            within = chains.var(axis = 1, ddof = 1, dtype = np.float64).mean()
+            between = n * chainMeans.var(ddof = 1)
+            result['rhat'] = np.sqrt(((n - 1) / n * within + between / n) / within)
+        return result
@@ -1,7 +1,7 @@
 import numpy as np
 import scipy.stats as stats
 import scipy.optimize as optimize
-import matplotlib.pyplot as plt
+from scipy.special import ndtr, ndtri
 
 
 class SignalDetection:
@@ -26,30 +26,30 @@ class SignalDetection:
 
     def hit_rate(self):
         """
-        Returns the hit rate based on the class object.
+        Returns the hit rate based on the class object, clipped away from 0 and 1.
         """
-        return self.hits / (self.hits + self.misses)
+        return SignalDetection._clip(self.hits / (self.hits + self.misses))
 
 
     def false_alarm_rate(self):
         """
-        Returns the false alarm rate based on the class object.
+        Returns the false alarm rate based on the class object, clipped away from 0 and 1.
         """
-        return self.falseAlarms / (self.falseAlarms + self.correctRejections)
+        return SignalDetection._clip(self.falseAlarms / (self.falseAlarms + self.correctRejections))
 
 
     def d_prime(self):
         """
         Returns the d-prime value given the hit rate and false alarm rate.
         """
-        return stats.norm.ppf(self.hit_rate()) - stats.norm.ppf(self.false_alarm_rate())
+        return ndtri(self.hit_rate()) - ndtri(self.false_alarm_rate())
 
 
     def criterion(self):
         """
         Returns the criterion value given the hit rate and false alarm rate.
         """
-        return -0.5 * stats.norm.ppf(self.hit_rate())-stats.norm.ppf(self.false_alarm_rate())
+        return -0.5 * ndtri(self.hit_rate())-ndtri(self.false_alarm_rate())
 
 
     # overloading the + and * methods
@@ -76,29 +76,27 @@ class SignalDetection:
 
 
     @staticmethod
-    def simulate(dPrime, criteriaList, signalCount, noiseCount):
-        """
-        simulate signal detection object
-        """
-        sdtList = []
-        for i in range(len(criteriaList)):
-            criteria = criteriaList[i]
-            k = criteria + dPrime / 2
-            hr = 1 - stats.norm.cdf(k - dPrime)
-            far = 1 - stats.norm.cdf(k)
-            hits = np.random.binomial(n=signalCount, p=hr)
-            misses = signalCount - hits
-            falseAlarms = np.random.binomial(n=noiseCount, p=far) #get the hr and far from the dprime
-            # and criteria list and then use those to do random number generation for hits, misses,
-            # false alarms and correct rejections
-            correctRejections = noiseCount - falseAlarms
-            sdtList.append(SignalDetection(hits, misses, falseAlarms, correctRejections))
-        return sdtList
+    def simulate(dPrime, criteriaList, signalCount, noiseCount, rng=None):
+        """
+        simulate signal detection object, one condition per criterion, returned as a
+        SignalDetectionArray. rng may be a numpy Generator or a seed for one.
+        """
+        rng = np.random.default_rng(rng)
+        #get the hr and far from the dprime and criteria list for all criteria at once, and then
+        # use those to do random number generation for hits, misses, false alarms and correct
+        # rejections
+        k = np.asarray(criteriaList, dtype=float) + dPrime / 2
+        hr = ndtr(dPrime - k)
+        far = ndtr(-k)
+        hits = rng.binomial(n=signalCount, p=hr)
+        falseAlarms = rng.binomial(n=noiseCount, p=far)
+        return SignalDetectionArray(hits, signalCount - hits, falseAlarms, noiseCount - falseAlarms)
 
 
     # adding ROC plot method
     @staticmethod
     def plot_roc(sdtList):
+        import matplotlib.pyplot as plt
         plt.plot([0,1], [0,1], 'k--', label= 'Chance')
         #variables to be used in plot
         for sdt in sdtList:
@@ -114,8 +112,8 @@ class SignalDetection:
 
 
     def nLogLikelihood(self, hit_rate, false_alarm_rate):
-        hit_rate = float(hit_rate)
-        false_alarm_rate = float(false_alarm_rate)
+        hit_rate = SignalDetection._clip(float(hit_rate))
+        false_alarm_rate = SignalDetection._clip(float(false_alarm_rate))
         return - ((self.hits * np.log(hit_rate)) +
                   (self.misses * np.log(1 - hit_rate)) +
                   (self.falseAlarms * np.log(false_alarm_rate)) +
@@ -124,52 +122,113 @@ class SignalDetection:
 
     @staticmethod
     def rocCurve(false_alarm_rate, a):
-        return stats.norm.cdf(a + stats.norm.ppf(false_alarm_rate))
+        return ndtr(a + ndtri(false_alarm_rate))
 
 
     @staticmethod
     def rocLoss(a, sdt_list):
         """L = SignalDetection.rocLoss(a, sdtList)
         L(a) = sum_i[ell(Phi[a + Phi^{-1}(gamma_i)],gamma_i; h_i, f_i, m_i, r_i)]"""
-        La = 0
-        for sdt in sdt_list:
-            La += SignalDetection.nLogLikelihood(sdt, SignalDetection.rocCurve
-            (sdt.false_alarm_rate(), a), sdt.false_alarm_rate())
-        return La
+        return SignalDetection._rocObjective(sdt_list)[0](a)
 
 
     @staticmethod
-    def fit_roc(sdtList):
-        a = 0
-        aHat = 0
-        for sdt in sdtList:
+    def rocLossGrad(a, sdt_list):
+        """dL = SignalDetection.rocLossGrad(a, sdtList)
+        dL/da = -sum_i[h_i phi(a + z_i) / Phi(a + z_i) - m_i phi(a + z_i) / (1 - Phi(a + z_i))],
+        where z_i = Phi^{-1}(gamma_i)"""
+        return SignalDetection._rocObjective(sdt_list)[1](a)
+
+
+    @staticmethod
+    def _rocObjective(sdt_list):
+        """
+        Returns the functions loss(a) and grad(a) behind rocLoss and rocLossGrad for a fixed
+        list of sdts. The counts, z_i = Phi^{-1}(gamma_i) and the false alarm terms do not
+        depend on a, so they are computed once here and each call only evaluates Phi(a + z_i).
+        The miss rate is computed as Phi(-(a + z_i)) rather than 1 - Phi(a + z_i) to keep its
+        precision, and the gradient of a term is zero wherever its rate is clipped.
+        """
+        hits, misses, falseAlarms, correctRejections = SignalDetection._counts(sdt_list)
+        far = SignalDetection._clip(falseAlarms / (falseAlarms + correctRejections))
+        z = ndtri(far)
+        faLoss = -(falseAlarms * np.log(far) + correctRejections * np.log1p(-far)).sum()
+
+        def loss(a):
+            x = np.squeeze(a) + z  # optimize.minimize passes a as a one-element array
+            hr = SignalDetection._clip(ndtr(x))
+            mr = SignalDetection._clip(ndtr(-x))
+            return faLoss - (hits * np.log(hr) + misses * np.log(mr)).sum()
+
+        def grad(a):
+            x = np.squeeze(a) + z
+            pdf = np.exp(-x ** 2 / 2) / np.sqrt(2 * np.pi)
+            hr, mr = ndtr(x), ndtr(-x)
+            hrClipped, mrClipped = SignalDetection._clip(hr), SignalDetection._clip(mr)
+            hitTerm = np.where(hrClipped == hr, hits * pdf / hrClipped, 0.0)
+            missTerm = np.where(mrClipped == mr, misses * pdf / mrClipped, 0.0)
+            return np.atleast_1d(-(hitTerm - missTerm).sum())
+
+        return loss, grad
+
+
+    @staticmethod
+    def _clip(rate, eps=1e-12):
+        """
+        Clips a rate to [eps, 1 - eps] so that its log and inverse normal cdf stay finite.
+        """
+        return np.clip(rate, eps, 1 - eps)
+
+
+    @staticmethod
+    def _counts(sdt_list):
+        """
+        Returns the hits, misses, false alarms and correct rejections of a list of sdts (or of a
+        SignalDetectionArray) as arrays.
+        """
+        if isinstance(sdt_list, SignalDetectionArray):
+            return np.array([sdt_list.hits, sdt_list.misses, sdt_list.falseAlarms,
+                             sdt_list.correctRejections], dtype=float)
+        return np.array(
+            [[sdt.hits, sdt.misses, sdt.falseAlarms, sdt.correctRejections] for sdt in sdt_list],
+            dtype=float).reshape(-1, 4).T
+
+
+    @staticmethod
+    def fit_roc(sdtList, plot=False):
+        """
+        Returns the maximum likelihood estimate of a. If plot is True, the data and the fitted
+        ROC curve are plotted as well.
+        """
+        #fitting the function: rocLoss already sums over all sdts, so a single minimization is
+        # enough, and the parts of the loss that do not depend on a are computed only once
+        loss, grad = SignalDetection._rocObjective(sdtList)
+        minimize = optimize.minimize(fun=loss, x0=0.0, jac=grad, method='BFGS')
+        aHat = minimize.x[0]
+        if plot:
+            import matplotlib.pyplot as plt
             SignalDetection.plot_roc(sdtList)
-            # noinspection PyTypeChecker
-            minimize = optimize.minimize(fun=sdt.rocLoss, args=sdtList, x0=a, method='BFGS')
-            #fitting the function: minimizing a
-            aHat = minimize.x
             x = np.linspace(0, 1, num=100)
-            y = sdt.rocCurve(x, aHat)
+            y = SignalDetection.rocCurve(x, aHat)
             plt.plot(x, y, 'r-', linewidth=2, markersize=8)
-        plt.ylabel('Hit Rate')
-        plt.xlabel('False Alarm Rate')
-        plt.title('Receive Operating Characteristic')
-        plt.legend()
+            plt.ylabel('Hit Rate')
+            plt.xlabel('False Alarm Rate')
+            plt.title('Receive Operating Characteristic')
+            plt.legend()
         return float(aHat)
 
 
     @staticmethod
     def plot_sdt(d_prime):
+        import matplotlib.pyplot as plt
         c = d_prime / 2  # threshold value
-        x = np.linspace(-4, 4, 1000)  # axes
+        x = np.linspace(-4, 4, 200)  # axes
         signal = stats.norm.pdf(x, loc=d_prime, scale=1) #signalcurve
         noise = stats.norm.pdf(x, loc=0, scale=1) #noisecurve
 
-        # calculate max of signal and noise curves for d' line
-        Nmax_y = np.max(noise)
-        Nmax_x = x[np.argmax(noise)]
-        Smax_y = np.max(signal)
-        Smax_x = x[np.argmax(signal)]
+        # max of signal and noise curves for d' line: unit normals peak at their means
+        Nmax_x, Smax_x = 0.0, d_prime
+        Nmax_y = Smax_y = 1 / np.sqrt(2 * np.pi)
 
         # plot curves
 
@@ -185,3 +244,85 @@ class SignalDetection:
         plt.show()
 
 
+class SignalDetectionArray:
+
+    def __init__(self, hits, misses, falseAlarms, correctRejections):
+        """
+        Initializes the class with one entry per condition for each signal detection variable,
+        stored as int64 arrays.
+        """
+        self.hits = np.asarray(hits).astype(np.int64)
+        self.misses = np.asarray(misses).astype(np.int64)
+        self.falseAlarms = np.asarray(falseAlarms).astype(np.int64)
+        self.correctRejections = np.asarray(correctRejections).astype(np.int64)
+
+
+    def __str__(self):
+        """
+        Returns the class as a labeled list to enable printing and error detection.
+        """
+        return f"hits: {self.hits}, misses: {self.misses}, false alarms: {self.falseAlarms}, " \
+               f"correct rejections: {self.correctRejections}"
+
+
+    def __len__(self):
+        return len(self.hits)
+
+
+    def __getitem__(self, i):
+        """
+        Returns condition i as a scalar SignalDetection object. A slice, mask or index array
+        returns the selected conditions as a SignalDetectionArray.
+        """
+        if isinstance(i, (int, np.integer)):
+            return SignalDetection(int(self.hits[i]), int(self.misses[i]),
+                                   int(self.falseAlarms[i]), int(self.correctRejections[i]))
+        return SignalDetectionArray(self.hits[i], self.misses[i], self.falseAlarms[i],
+                                    self.correctRejections[i])
+
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+    def hit_rate(self):
+        """
+        Returns the hit rate of every condition, clipped away from 0 and 1.
+        """
+        return SignalDetection._clip(self.hits / (self.hits + self.misses))
+
+
+    def false_alarm_rate(self):
+        """
+        Returns the false alarm rate of every condition, clipped away from 0 and 1.
+        """
+        return SignalDetection._clip(self.falseAlarms / (self.falseAlarms + self.correctRejections))
+
+
+    def d_prime(self):
+        """
+        Returns the d-prime value of every condition.
+        """
+        return ndtri(self.hit_rate()) - ndtri(self.false_alarm_rate())
+
+
+    def criterion(self):
+        """
+        Returns the criterion value c = -(Phi^{-1}(H) + Phi^{-1}(F)) / 2 of every condition.
+        """
+        return -0.5 * (ndtri(self.hit_rate()) + ndtri(self.false_alarm_rate()))
+
+
+    def nLogLikelihood(self, hit_rate, false_alarm_rate):
+        """
+        Returns the negative log-likelihood summed over all conditions, given per-condition
+        (or shared) hit and false alarm rates.
+        """
+        hit_rate = SignalDetection._clip(hit_rate)
+        false_alarm_rate = SignalDetection._clip(false_alarm_rate)
+        return - ((self.hits * np.log(hit_rate)) +
+                  (self.misses * np.log1p(-hit_rate)) +
+                  (self.falseAlarms * np.log(false_alarm_rate)) +
+                  (self.correctRejections * np.log1p(-false_alarm_rate))).sum()
+
+
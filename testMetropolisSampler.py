@@ -0,0 +1,144 @@
+import unittest
+import numpy as np
+from Metropolis import Metropolis
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def logNormal(x):
+    return -0.5 * (x - 2.0) ** 2
+
+
+def logUniform(x):
+    return 0.0 if 0.0 <= x <= 1.0 else -np.inf
+
+
+class TestMetropolis(unittest.TestCase):
+    @unittest.skipIf(numba is None, "numba is not installed")
+    def test_jittedMatchesPython(self):
+        # The compiled loop must consume the same random stream as the Python loop
+        jitted = numba.njit(logNormal)
+        samplers = []
+        for logTarget in [logNormal, jitted]:
+            sampler = Metropolis(logTarget, 0.0, seed = 7, dtype = np.float64)
+            sampler.sample(2000)
+            samplers.append(sampler)
+        python, compiled = samplers
+        np.testing.assert_allclose(compiled.samples, python.samples, rtol = 1e-12)
+        self.assertEqual(compiled.acceptCount, python.acceptCount)
+        self.assertAlmostEqual(compiled.currentLogTarget, python.currentLogTarget, places = 10)
+
+    @unittest.skipIf(numba is None, "numba is not installed")
+    def test_runChainsJittedMatchesPython(self):
+        # The prange path must draw the same random numbers per chain as the joblib path
+        jitted = numba.njit(logNormal)
+        for blockLengths in [None, [200] * 3]:
+            python = Metropolis.run_chains(logNormal, [0.0, 1.0, 5.0], 1000,
+                                           blockLengths = blockLengths, seed = 11,
+                                           dtype = np.float64)
+            compiled = Metropolis.run_chains(jitted, [0.0, 1.0, 5.0], 1000,
+                                             blockLengths = blockLengths, seed = 11,
+                                             dtype = np.float64)
+            np.testing.assert_allclose(compiled, python, rtol = 1e-10)
+
+    @unittest.skipIf(numba is None, "numba is not installed")
+    def test_jittedMatchesPythonInfiniteRegions(self):
+        # Both paths must reject moves between -inf states (the log ratio is nan)
+        jitted = numba.njit(logUniform)
+        samplers = []
+        for logTarget in [logUniform, jitted]:
+            sampler = Metropolis(logTarget, 5.0, seed = 3, dtype = np.float64)
+            sampler.adapt([10]).sample(10)
+            samplers.append(sampler)
+        python, compiled = samplers
+        np.testing.assert_array_equal(compiled.samples, python.samples)
+        self.assertEqual(compiled.acceptCount, python.acceptCount)
+        self.assertTrue(np.all(python.samples[:11] == 5.0))
+
+    def test_adapt(self):
+        # For a 1-D normal target, acceptance 0.44 corresponds to a step of about 2.4 sigma
+        sigma = 3.0
+        for initialStep in [1.0, 0.01, 100.0]:
+            sampler = Metropolis(lambda x: -0.5 * ((x - 2.0) / sigma) ** 2, 0.0, seed = 4)
+            sampler.stepSize = initialStep
+            sampler.adapt([2000] * 3)
+            self.assertAlmostEqual(sampler.acceptanceRate, 0.44, delta = 0.05)
+            self.assertGreater(sampler.stepSize, 1.8 * sigma)
+            self.assertLess(sampler.stepSize, 3.0 * sigma)
+            self.assertEqual(sampler.adaptIterations, 6000)
+
+    def test_sampleDtype(self):
+        sampler = Metropolis(logNormal, 0.0, seed = 1).adapt([100]).sample(200)
+        self.assertEqual(sampler.samples.dtype, np.float32)
+        self.assertIsInstance(sampler.currentState, float)
+        self.assertNotIsInstance(sampler.currentState, np.float32)
+        sampler = Metropolis(logNormal, 0.0, seed = 1, dtype = np.float64).sample(200)
+        self.assertEqual(sampler.samples.dtype, np.float64)
+        self.assertEqual(Metropolis.run_chains(logNormal, [0.0, 1.0], 100, seed = 1).dtype,
+                         np.float32)
+        self.assertEqual(Metropolis.run_chains(logNormal, [0.0, 1.0], 100, seed = 1,
+                                               dtype = np.float64).dtype, np.float64)
+
+    @unittest.skipIf(numba is None, "numba is not installed")
+    def test_sampleDtypeJitted(self):
+        jitted = numba.njit(logNormal)
+        sampler = Metropolis(jitted, 0.0, seed = 1).adapt([100]).sample(200)
+        self.assertEqual(sampler.samples.dtype, np.float32)
+        self.assertIsInstance(sampler.currentState, float)
+        sampler = Metropolis(jitted, 0.0, seed = 1, dtype = np.float64).sample(200)
+        self.assertEqual(sampler.samples.dtype, np.float64)
+        self.assertEqual(Metropolis.run_chains(jitted, [0.0, 1.0], 100, seed = 1).dtype,
+                         np.float32)
+        self.assertEqual(Metropolis.run_chains(jitted, [0.0, 1.0], 100, seed = 1,
+                                               dtype = np.float64).dtype, np.float64)
+
+    def test_runChainsShape(self):
+        chains = Metropolis.run_chains(logNormal, [0.0, 1.0, 3.0], 500, blockLengths = [100] * 2,
+                                       seed = 1)
+        self.assertEqual(chains.shape, (3, 500))
+        chains = Metropolis.run_chains(logNormal, [0.0, 1.0], 0, seed = 1)
+        self.assertEqual(chains.shape, (2, 0))
+
+    def test_runChainsReproducible(self):
+        chains1 = Metropolis.run_chains(logNormal, [0.0, 1.0], 500, blockLengths = [100], seed = 3)
+        chains2 = Metropolis.run_chains(logNormal, [0.0, 1.0], 500, blockLengths = [100], seed = 3)
+        chains3 = Metropolis.run_chains(logNormal, [0.0, 1.0], 500, blockLengths = [100], seed = 4)
+        np.testing.assert_array_equal(chains1, chains2)
+        self.assertFalse(np.array_equal(chains1, chains3))
+
+    def test_runChainsIndependent(self):
+        # Chains started from the same state must not share a random stream
+        chains = Metropolis.run_chains(logNormal, [0.0, 0.0], 5000, seed = 5)
+        self.assertFalse(np.array_equal(chains[0], chains[1]))
+        correlation = np.corrcoef(np.diff(chains[0]), np.diff(chains[1]))[0, 1]
+        self.assertLess(abs(correlation), 0.1)
+
+    def test_summarizeChains(self):
+        chains = np.array([[1.0, 2.0, 3.0],
+                           [2.0, 3.0, 4.0]])
+        result = Metropolis.summarize_chains(chains)
+        # W = 1, B = 3 * 0.5 = 1.5, var = 2/3 * W + B/3 = 7/6
+        self.assertAlmostEqual(result['rhat'], np.sqrt(7 / 6), places = 12)
+        self.assertAlmostEqual(result['mean'], 2.5, places = 12)
+        self.assertAlmostEqual(result['c025'], 1.125, places = 12)
+        self.assertAlmostEqual(result['c975'], 3.875, places = 12)
+        self.assertAlmostEqual(result['chains'][0]['mean'], 2.0, places = 12)
+        self.assertAlmostEqual(result['chains'][1]['c025'], 2.05, places = 12)
+        self.assertAlmostEqual(result['chains'][1]['c975'], 3.95, places = 12)
+        self.assertTrue(np.isnan(Metropolis.summarize_chains(chains[0])['rhat']))
+
+    def test_summary(self):
+        sampler = Metropolis(logNormal, 0.5, seed = 2)
+        sampler.adapt([300] * 2).sample(1001).adapt([200]).sample(500)
+        result = sampler.summary()
+        self.assertEqual(sampler.samples.size, 1 + 600 + 1001 + 200 + 500)
+        self.assertAlmostEqual(result['mean'], np.mean(sampler.samples, dtype = np.float64),
+                               places = 10)
+        self.assertAlmostEqual(result['c025'], np.percentile(sampler.samples, 2.5), places = 5)
+        self.assertAlmostEqual(result['c975'], np.percentile(sampler.samples, 97.5), places = 5)
+
+if __name__ == '__main__':
+    unittest.main()
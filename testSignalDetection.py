@@ -1,7 +1,8 @@
 import unittest
 import matplotlib.pyplot as plt
 import numpy as np
-from SignalDetection import SignalDetection
+import scipy.stats
+from SignalDetection import SignalDetection, SignalDetectionArray
 
 class TestSignalDetection(unittest.TestCase):
     def test_simulate(self):
@@ -33,6 +34,46 @@ class TestSignalDetection(unittest.TestCase):
             self.assertLessEqual    (sdt.falseAlarms       ,  noiseCount)
             self.assertLessEqual    (sdt.correctRejections ,  noiseCount)
 
+        # Test that a seed makes the simulation reproducible
+        sdtArray1    = SignalDetection.simulate(dPrime, criteriaList, signalCount, noiseCount, rng=42)
+        sdtArray2    = SignalDetection.simulate(dPrime, criteriaList, signalCount, noiseCount, rng=42)
+        np.testing.assert_array_equal(sdtArray1.hits       , sdtArray2.hits)
+        np.testing.assert_array_equal(sdtArray1.falseAlarms, sdtArray2.falseAlarms)
+
+    def test_signalDetectionArray(self):
+        sdtList = [
+            SignalDetection( 8, 2, 1, 9),
+            SignalDetection(14, 1, 2, 8),
+        ]
+        sdtArray = SignalDetectionArray([8, 14], [2, 1], [1, 2], [9, 8])
+        self.assertEqual(len(sdtArray), 2)
+        for i, sdt in enumerate(sdtList):
+            self.assertEqual(sdtArray[i].hits, sdt.hits)
+            self.assertAlmostEqual(sdtArray.hit_rate()[i], sdt.hit_rate(), places=10)
+            self.assertAlmostEqual(sdtArray.false_alarm_rate()[i], sdt.false_alarm_rate(), places=10)
+            self.assertAlmostEqual(sdtArray.d_prime()[i], sdt.d_prime(), places=10)
+        self.assertAlmostEqual(SignalDetection.rocLoss(0.5, sdtArray),
+                               SignalDetection.rocLoss(0.5, sdtList), places=10)
+
+    def test_signalDetectionArrayCriterion(self):
+        sdtArray = SignalDetectionArray([10, 8], [5, 2], [3, 1], [12, 9])
+        hitRates = np.array([10 / 15, 8 / 10])
+        falseAlarmRates = np.array([3 / 15, 1 / 10])
+        expected = -0.5 * (scipy.stats.norm.ppf(hitRates) + scipy.stats.norm.ppf(falseAlarmRates))
+        np.testing.assert_allclose(sdtArray.criterion(), expected, rtol=1e-10)
+        self.assertAlmostEqual(sdtArray.criterion()[0], 0.205, places=3)
+
+    def test_signalDetectionArraySlicing(self):
+        sdtArray = SignalDetectionArray([8, 14, 10], [2, 1, 3], [1, 2, 1], [9, 8, 9])
+        for selected in [sdtArray[0:2], sdtArray[[0, 1]], sdtArray[np.array([True, True, False])]]:
+            self.assertIsInstance(selected, SignalDetectionArray)
+            self.assertEqual(len(selected), 2)
+            np.testing.assert_array_equal(selected.hits, [8, 14])
+            np.testing.assert_array_equal(selected.correctRejections, [9, 8])
+        self.assertEqual(len(sdtArray[1:1]), 0)
+        self.assertEqual(sdtArray[np.int64(2)].misses, 3)
+        self.assertEqual(sdtArray[-1].hits, 10)
+
     def test_nLogLikelihood(self):
         sdt = SignalDetection(10, 5, 3, 12)
         hit_rate = 0.5
@@ -55,6 +96,41 @@ class TestSignalDetection(unittest.TestCase):
         expected = 99.3884206555698
         self.assertAlmostEqual(SignalDetection.rocLoss(a, sdtList), expected, places=4)
 
+        # An empty list contributes nothing to the loss
+        self.assertEqual(SignalDetection.rocLoss(a, []), 0)
+        self.assertEqual(SignalDetection.rocLossGrad(a, [])[0], 0)
+        self.assertEqual(SignalDetection.fit_roc([]), 0)
+
+    def test_rocLossGrad(self):
+        sdtList = [
+            SignalDetection( 8, 2, 1, 9),
+            SignalDetection(14, 1, 2, 8),
+            SignalDetection(10, 3, 1, 9),
+            SignalDetection(11, 2, 2, 8),
+        ]
+        a = 0.7
+        h = 1e-6
+        expected = (SignalDetection.rocLoss(a + h, sdtList) -
+                    SignalDetection.rocLoss(a - h, sdtList)) / (2 * h)
+        self.assertAlmostEqual(SignalDetection.rocLossGrad(a, sdtList)[0], expected, places=4)
+
+        # The gradient must match the clipped loss far out in the tails as well
+        for a in [5, 8, 9, -9]:
+            expected = (SignalDetection.rocLoss(a + h, sdtList) -
+                        SignalDetection.rocLoss(a - h, sdtList)) / (2 * h)
+            self.assertAlmostEqual(SignalDetection.rocLossGrad(a, sdtList)[0], expected, places=3)
+
+    def test_boundaryRates(self):
+        # Perfect scores are clipped instead of giving infinite d prime or loss
+        self.assertTrue(np.isfinite(SignalDetection(10, 0, 0, 10).d_prime()))
+        sdtList = [
+            SignalDetection(10, 0, 0, 10),
+            SignalDetection(10, 0, 5,  5),
+        ]
+        self.assertTrue(np.isfinite(SignalDetection.rocLoss(0, sdtList)))
+        self.assertTrue(np.isfinite(SignalDetection.fit_roc(sdtList)))
+        self.assertTrue(np.isfinite(SignalDetection.fit_roc([SignalDetection(0, 10, 10, 0)])))
+
     def test_integration(self):
         dPrime = 1
         sdtList = SignalDetection.simulate(dPrime, [-1, 0, 1], 1e7, 1e7)